@@ -1,133 +1,796 @@
+import asyncio
 import csv
+import functools
+import hashlib
+import importlib.util
+import itertools
 import json
+import logging
+import random
 import re
+import socket
+import string
 import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Any
 import os
 
-# Setting up the Gemini 3(Preview)
+# Setting up the Gemini 3(Preview). Only the package's presence is checked
+# here; google-genai (and the HTTP/auth stack behind it) is imported when a
+# GeminiBackend is created, so rules workers and importers of this module
+# never load it.
 try:
-    from google import genai
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    HAS_GEMINI = True
-except ImportError:
-    client = None
-    HAS_GEMINI = False
-    print("Warning: google-genai package not installed. Install with: pip install google-genai")
-    print(" LLM-based classification will be skipped. Using rules-only approach.\n")
-except Exception as e:
-    client = None
+    HAS_GEMINI = importlib.util.find_spec("google.genai") is not None
+except ModuleNotFoundError:  # no "google" namespace package at all
     HAS_GEMINI = False
-    print(f"Warning: Could not configure Gemini API: {e}")
-    print("Make sure GEMINI_API_KEY environment variable is set.\n")
+
+# Optional faster JSON codec; the stdlib fallback produces the same output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional progress bar over the output rows
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# Per-batch LLM progress is logged at INFO; set LOG_LEVEL=INFO to see it.
+# Failed batches are always reported as warnings.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = 'gemini-3-flash-preview'
+
+# Rows sent per LLM request. Gains flatten out past ~16-32 rows as each
+# (longer) request takes more time, so keep this moderate.
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", "32"))
+
+# Batches in flight at once, and the request budget shared by all of them.
+# The pipeline is network-bound, so latency drops roughly linearly with the
+# worker count until the provider's requests-per-minute cap is reached.
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", "48"))
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "500"))
+
+# Hosted LLM latency has a long tail. Each attempt gets a hard deadline and
+# timeouts, connection errors and 429/5xx responses are retried with jittered
+# exponential backoff. Once enough requests have completed, one still running
+# past the 95th percentile of recent latencies is raced against a duplicate.
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "5"))
+LLM_BACKOFF_INITIAL = 0.5
+LLM_BACKOFF_MAX = 8.0
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Input is read through a 1 MiB buffer and handed to the rules pass in blocks;
+# line-oriented outputs (the clean CSV, the LLM cache) are written through one
+# of OUTPUT_WRITE_BUFFER bytes
+CSV_READ_BUFFER = 1 << 20
+CSV_BLOCK_ROWS = 4096
+OUTPUT_WRITE_BUFFER = 1 << 20
+
+# Owner/device inputs queued for the LLM before they are flushed and their rows
+# emitted, so memory for pending LLM work stays flat however large the input
+LLM_QUEUE_ROWS = 1024
+
+# Processes running the CPU-bound rules pass when the input spans more than one
+# block (1 keeps it in the main process). LLM calls always stay in the main
+# process so the rate limiter and cache are shared.
+RULES_WORKERS = int(os.environ.get("RULES_WORKERS", str(os.cpu_count() or 1)))
+
+# Sidecar file persisting LLM results between runs (empty string disables it)
+LLM_CACHE_FILE = os.environ.get("LLM_CACHE_FILE", ".llm_cache.jsonl")
+
+KNOWN_DEVICE_TYPES = ["server", "router", "switch", "printer", "iot", "firewall", "access point", "workstation"]
+# Lowercased device_type value -> canonical type, for values that map to a type
+# without any doubt: the known types and common abbreviations of them. A hit
+# skips the LLM; anything else is classified from the hostname and notes.
+_DEVICE_TYPE_LOOKUP = {device_type: device_type for device_type in KNOWN_DEVICE_TYPES}
+_DEVICE_TYPE_LOOKUP.update({
+    "srv": "server",
+    "rtr": "router",
+    "sw": "switch",
+    "cam": "iot",
+    "camera": "iot",
+    "ap": "access point",
+    "wap": "access point",
+    "access_point": "access point",
+    "fw": "firewall",
+    "pc": "workstation",
+    "desktop": "workstation",
+    "laptop": "workstation",
+})
+
+
+class OutputRow(NamedTuple):
+    """One row of inventory_clean.csv, fields in column order.
+    
+    Being a tuple, it is written by csv.writer as-is.
+    """
+    ip: str
+    ip_valid: str
+    ip_version: str
+    subnet_cidr: str
+    hostname: str
+    hostname_valid: str
+    fqdn: str
+    fqdn_consistent: str
+    reverse_ptr: str
+    mac: str
+    mac_valid: str
+    owner: str
+    owner_email: str
+    owner_team: str
+    device_type: str
+    device_type_confidence: str
+    site: str
+    site_normalized: str
+    source_row_id: str
+    normalization_steps: str
+
+
+OUTPUT_FIELDNAMES = OutputRow._fields
+
+
+class RuleRecord(NamedTuple):
+    """Rules-pass result for one input row, held until its LLM fields are resolved.
+    
+    A tuple rather than a dict or plain object, so a block of records carries
+    no per-row __dict__ and pickles compactly back from rules workers.
+    """
+    output_row: OutputRow
+    steps: List[str]
+    owner: str
+    owner_parsed: Optional[Tuple[str, str, str]]  # fast-path owner fields, or None
+    device: Optional[Tuple[str, str]]  # known (device_type, confidence), or None
+    device_inputs: Tuple[str, str, str]  # (hostname, notes, ip) for classification
+
+# Character classes for RFC 1123 labels (hostnames and each FQDN label)
+_ALNUM = frozenset(string.ascii_letters + string.digits)
+_DELETE_LABEL_CHARS = str.maketrans("", "", string.ascii_letters + string.digits + "-")
+
+# MAC separators to delete, and the canonical output format
+_MAC_STRIP = str.maketrans('', '', '-:.')
+_MAC_FMT = '{:02x}:{:02x}:{:02x}:{:02x}:{:02x}:{:02x}'
+
+# Lowercase owner texts that are team/department names (the prompt's "ops",
+# "platform", "security", "facilities" and "sec" plus common ones). Only these
+# are parsed as a team without the LLM: a lone lowercase word may just as well
+# be a person's name like "priya".
+_OWNER_TEAMS = frozenset({
+    "ops", "platform", "sec", "security", "facilities", "engineering",
+    "net", "network", "infra", "devops", "sre", "it",
+})
+
+# Canonical forms of the site abbreviations matched by _SITE_FUSED_RE
+_SITE_ABBREVIATIONS = {
+    'bldg': 'Building',
+    'building': 'Building',
+    'campus': 'Campus',
+    'hq': 'HQ',
+    'lab': 'Lab',
+    'dc': 'DC',
+}
+
+# Structured-output schemas for the batch responses: Gemini returns a JSON array
+# whose objects carry the batch id and exactly these fields
+_OWNER_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "name": {"type": "STRING"},
+            "email": {"type": "STRING"},
+            "team": {"type": "STRING"},
+        },
+        "required": ["id", "name", "email", "team"],
+    },
+}
+_DEVICE_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "device_type": {"type": "STRING", "enum": KNOWN_DEVICE_TYPES + ["unknown"]},
+            "confidence": {"type": "NUMBER"},
+            "reasoning": {"type": "STRING"},
+        },
+        "required": ["id", "device_type", "confidence", "reasoning"],
+    },
+}
+
+# Rules-fallback device keywords, highest-priority type first
+_DEVICE_KEYWORDS = (
+    ("server", ("srv", "server", "db", "host", "sql", "web", "app")),
+    ("router", ("rtr", "router", "gw", "gateway", "edge")),
+    ("switch", ("sw", "switch", "core")),
+    ("printer", ("print", "printer")),
+    ("iot", ("cam", "camera", "iot", "sensor")),
+    ("access point", ("ap", "access", "wireless", "wifi")),
+    ("firewall", ("fw", "firewall")),
+    ("workstation", ("pc", "laptop", "desktop", "workstation")),
+)
+
+# --- compiled regexes ---
+# Every pattern used on the row path, compiled once at import. Groups that are
+# never read are non-capturing.
+
+# Owner fields: an email address anywhere, and a "(team)" in parentheses
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_TEAM_PAREN_RE = re.compile(r'\(([^)]+)\)')
+
+# Site normalization in a single pass: runs of separators/whitespace, whole-word
+# abbreviations (underscores count as word breaks since they become spaces) and
+# letter->digit boundaries each get their replacement from _site_repl
+_SITE_FUSED_RE = re.compile(
+    r'[-_\s]+'
+    r'|(?P<abbr>(?<![^\W_])(?i:bldg|building|campus|hq|lab|dc)(?![^\W_]))'
+    r'|(?<=[a-zA-Z])(?=\d)'
+)
+
+
+def _site_repl(m: re.Match) -> str:
+    """Replacement for one _SITE_FUSED_RE match."""
+    abbr = m.group('abbr')
+    if abbr is not None:
+        return _SITE_ABBREVIATIONS[abbr.lower()]
+    # Separator run or letter->digit boundary (e.g. "Building1" -> "Building 1")
+    return ' '
+
+
+# System instructions for the batch requests. They go out unchanged with fixed
+# sampling settings and each request's contents is only its JSON array of
+# inputs, so the prefix stays byte-identical for the provider's implicit
+# prompt caching
+OWNER_SYSTEM_PROMPT = """Parse the owner information from each entry in the JSON array of the request into structured fields. Each entry has an "id" and the owner text in "owner".
+
+IMPORTANT INSTRUCTIONS:
+1. If the text is a PROPER NOUN (person's name like "John", "Priya", "Jane"), put it in "name"
+2. If the text is a COMMON NOUN (team/department like "ops", "platform", "security", "facilities"), put it in "team"
+3. Extract any email addresses found
+4. A team in parentheses like "(engineering)" goes in "team"
+
+Examples:
+
+Input: "priya (platform) priya@corp.example.com"
+Output: {"name": "priya", "email": "priya@corp.example.com", "team": "platform"}
+(Person name + team + email)
+
+Input: "ops"
+Output: {"name": "", "email": "", "team": "ops"}
+(Common noun = team, not a person name)
+
+Input: "platform"
+Output: {"name": "", "email": "", "team": "platform"}
+(Common noun = team, not a person name)
+
+Input: "Facilities"
+Output: {"name": "", "email": "", "team": "Facilities"}
+(Department/team, not a person)
+
+Input: "jane@corp.example.com"
+Output: {"name": "jane", "email": "jane@corp.example.com", "team": ""}
+(Email provides the name)
+
+Input: "sec"
+Output: {"name": "", "email": "", "team": "sec"}
+(Short for security team)
+
+Extract and return for each text:
+- id: The entry's id, unchanged
+- name: Person's name (empty string if the text is a team/department)
+- email: Email address (empty string if not present)
+- team: Team/department name (empty string if the text is a person's name)
+
+Respond ONLY with a valid JSON array containing one object per entry, each with the entry's id, no additional text."""
+
+DEVICE_SYSTEM_PROMPT = """Classify the network device type of each device in the JSON array of the request based on the information provided. Each device has an "id".
+
+IMPORTANT INSTRUCTIONS:
+- Analyze the hostname patterns and notes carefully
+- If there is clear evidence (hostname contains srv, sw, rtr, etc. OR notes describe the device), classify it
+- If there is NO clear supporting information to determine the device type, respond with "unknown"
+- Do NOT guess if the information is insufficient
+
+Common patterns to look for:
+- Servers: srv, host, db, web, app, sql
+- Routers: rtr, router, gw, gateway, edge
+- Switches: sw, switch, core
+- Printers: print, printer
+- IoT devices: cam, camera, iot, sensor
+- Access Points: ap, wireless, wifi
+- Firewalls: fw, firewall
+
+Respond with a JSON array containing one object per device, each with the device's id:
+[{"id": 0, "device_type": "server", "confidence": 0.85, "reasoning": "Brief explanation of why you chose this classification"}]
+
+Valid device types: server, router, switch, printer, iot, firewall, access point, workstation, unknown
+
+If uncertain or no clear indicators exist, use device_type: "unknown" with low confidence."""
+
+# Request configs, built once and shared by every request of a purpose
+_OWNER_REQUEST_CONFIG = {
+    'system_instruction': OWNER_SYSTEM_PROMPT,
+    'temperature': 0,
+    'response_mime_type': 'application/json',
+    'response_schema': _OWNER_RESPONSE_SCHEMA
+}
+_DEVICE_REQUEST_CONFIG = {
+    'system_instruction': DEVICE_SYSTEM_PROMPT,
+    'temperature': 0,
+    'response_mime_type': 'application/json',
+    'response_schema': _DEVICE_RESPONSE_SCHEMA
+}
+
+# Everything besides the input that shapes an answer (model, system prompt,
+# schema, sampling), digested per purpose. It is part of every LLM cache key,
+# so changing any of it stops answers cached under the old setup from being
+# reused.
+_REQUEST_FINGERPRINTS = {
+    purpose: hashlib.sha1(json.dumps([GEMINI_MODEL, config], sort_keys=True).encode("utf-8")).hexdigest()
+    for purpose, config in (
+        ("owner_parsing", _OWNER_REQUEST_CONFIG),
+        ("device_type_classification", _DEVICE_REQUEST_CONFIG),
+    )
+}
+
+def is_valid_label(label: str) -> bool:
+    """RFC 1123 label: 1-63 alphanumerics/hyphens, starting and ending alphanumeric."""
+    # Deleting every allowed character must leave nothing behind
+    return (0 < len(label) <= 63
+            and label[0] in _ALNUM
+            and label[-1] in _ALNUM
+            and not label.translate(_DELETE_LABEL_CHARS))
+
+
+# IP helpers below depend only on the packed address (or a prefix of it) and
+# inventories reuse the same subnets heavily, so results are memoized
+@functools.lru_cache(maxsize=65536)
+def classify_ipv4_type(prefix: bytes) -> str:
+    """Classify IPv4 address type from its first two packed octets."""
+    if prefix[0] == 10:
+        return "private_rfc1918"
+    if prefix[0] == 172 and 16 <= prefix[1] <= 31:
+        return "private_rfc1918"
+    if prefix[0] == 192 and prefix[1] == 168:
+        return "private_rfc1918"
+    if prefix[0] == 169 and prefix[1] == 254:
+        return "link_local_apipa"
+    if prefix[0] == 127:
+        return "loopback"
+    
+    return "public_or_other"
+
+
+@functools.lru_cache(maxsize=65536)
+def _default_subnet_for_prefix(prefix: bytes) -> str:
+    """Default subnet for the first three packed octets of an address."""
+    if classify_ipv4_type(prefix[:2]) == "private_rfc1918":
+        return f"{prefix[0]}.{prefix[1]}.{prefix[2]}.0/24"
+    return ""
+
+
+def default_subnet(octets: bytes) -> str:
+    """Generate default /24 subnet CIDR for private addresses (cached per /24)."""
+    return _default_subnet_for_prefix(octets[:3])
+
+
+@functools.lru_cache(maxsize=65536)
+def generate_reverse_ptr(octets: bytes) -> str:
+    """Generate reverse PTR record from packed octets."""
+    return f"{octets[3]}.{octets[2]}.{octets[1]}.{octets[0]}.in-addr.arpa"
+
+
+def dump_json(obj: Any) -> bytes:
+    """Serialize obj as 2-space indented UTF-8 JSON, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def dump_json_line(obj: Any) -> bytes:
+    """Serialize obj as compact single-line UTF-8 JSON, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def load_json(text: Any) -> Any:
+    """Parse JSON text (str or UTF-8 bytes), using orjson when installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def scatter_by_id(result: Any, size: int) -> List[Optional[Dict]]:
+    """Put the objects of a batch response back in batch order by their "id".
+    
+    Raises ValueError unless the response is a JSON array of objects. Ids
+    that are missing, repeated or out of range leave None in their slot; a
+    response without any ids is taken in order if its length matches.
+    """
+    if not isinstance(result, list) or not all(isinstance(item, dict) for item in result):
+        raise ValueError("expected a JSON array of objects")
+    if len(result) == size and all("id" not in item for item in result):
+        return result
+    
+    items = [None] * size
+    for item in result:
+        idx = item.get("id")
+        if type(idx) is int and 0 <= idx < size and items[idx] is None:
+            items[idx] = item
+    return items
+
+
+def prompt_digest(prompt: str) -> str:
+    """Short, stable identifier for a prompt, logged instead of the full text."""
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def map_column(fn, values: List[str]) -> List[Any]:
+    """Apply a pure rules function to a whole column, once per distinct value."""
+    distinct = list(dict.fromkeys(values))
+    results = dict(zip(distinct, map(fn, distinct)))
+    return [results[value] for value in values]
+
+
+def lookup_device_type(value: str) -> Optional[str]:
+    """Canonical device type for an explicitly provided (stripped) device_type value, or None."""
+    return _DEVICE_TYPE_LOOKUP.get(value.lower())
+
+
+def owner_cache_key(owner: str) -> str:
+    """Cache key for an owner field: whitespace-collapsed (case is kept, it tells names from teams)."""
+    return " ".join(owner.split())
+
+
+def device_cache_key(hostname: str, notes: str, ip_addr: str) -> str:
+    """Cache key for a device classification input: lowercased and whitespace-collapsed."""
+    return "\x1f".join(" ".join(value.split()).lower() for value in (hostname, notes, ip_addr))
+
+
+def llm_cache_key(purpose: str, normalized_input: str) -> str:
+    """Content address of one LLM input in the cache, under the current request setup."""
+    return hashlib.sha1(
+        f"{purpose}\0{_REQUEST_FINGERPRINTS[purpose]}\0{normalized_input}".encode("utf-8")
+    ).hexdigest()
+
+
+# Names of the per-purpose result fields kept in the LLM call log
+_LOG_FIELDS = {
+    "owner_parsing": ("parsed_name", "parsed_email", "parsed_team"),
+    "device_type_classification": ("classification", "confidence", "reasoning"),
+}
+
+# A batch's record of one request: (result fields, prompt sha1, response text)
+LLMLogEntry = Tuple[Tuple, str, str]
+
+
+class LLMLog:
+    """Call log of one LLM purpose, stored column-wise.
+    
+    Entry i covers the rows row_ids[i], which share one input; fields[i] is
+    the result tuple in _LOG_FIELDS order. Requests sent for the entry are
+    identified by prompt_sha1s[i] and responses[i] (both empty for a cache
+    hit). Parallel lists avoid a dict per logged input.
+    """
+    __slots__ = ("row_ids", "fields", "cache_hits", "prompt_sha1s", "responses")
+    
+    def __init__(self):
+        self.row_ids = []
+        self.fields = []
+        self.cache_hits = []
+        self.prompt_sha1s = []
+        self.responses = []
+    
+    def __len__(self) -> int:
+        return len(self.row_ids)
+    
+    def append(self, row_ids: List[str], fields: Tuple, cache_hit: bool = False,
+               prompt_sha1: str = "", response: str = ""):
+        self.row_ids.append(row_ids)
+        self.fields.append(fields)
+        self.cache_hits.append(cache_hit)
+        self.prompt_sha1s.append(prompt_sha1)
+        self.responses.append(response)
+    
+    def entries(self, purpose: str) -> Iterator[Dict]:
+        """Rebuild the entries as dicts (for callers wanting one record per input)."""
+        for i in range(len(self.row_ids)):
+            entry = {"purpose": purpose, **dict(zip(_LOG_FIELDS[purpose], self.fields[i])),
+                     "source_row_id": self.row_ids[i][0], "affected_row_ids": self.row_ids[i]}
+            if self.cache_hits[i]:
+                entry["cache_hit"] = True
+            else:
+                entry["prompt_sha1"] = self.prompt_sha1s[i]
+                entry["response"] = self.responses[i]
+            yield entry
+
+
+# Transport error base classes of the HTTP stacks google-genai can use, by
+# (top-level package, class name), so neither library has to be imported to
+# match them. Both subclass plain Exception rather than OSError.
+_TRANSPORT_ERRORS = {("httpx", "TransportError"), ("aiohttp", "ClientError")}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection failures and 429/5xx API errors are worth retrying."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any((cls.__module__.partition(".")[0], cls.__name__) in _TRANSPORT_ERRORS for cls in type(error).__mro__):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number `attempt` (1-based): exponential, capped, plus jitter."""
+    return min(LLM_BACKOFF_MAX, LLM_BACKOFF_INITIAL * 2 ** (attempt - 1)) + random.uniform(0, LLM_BACKOFF_INITIAL)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per `period` seconds, shared by concurrent LLM tasks."""
+    
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate = rate
+        self.period = period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+    
+    async def acquire(self):
+        """Wait until a token is available, then consume it."""
+        while True:
+            # No await between the check and the update, so this is atomic
+            # with respect to other tasks on the event loop
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
+
+
+class GeminiBackend:
+    """LLM backend sending JSON-mode requests to Gemini through one client.
+    
+    Holds the request budget (rate limiter), the latency history used for
+    hedging and the count of requests sent.
+    """
+    enabled = True
+    
+    def __init__(self):
+        from google import genai
+        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+        # Latencies of the last successful requests, for the hedging threshold
+        self.request_latencies = deque(maxlen=200)
+        self.requests_sent = 0
+    
+    async def generate_json(self, prompt: str, config: Dict) -> str:
+        """Send one prompt to Gemini in JSON mode and return the response text.
+        
+        config is one of the shared request configs, carrying the system
+        instruction and response schema. Retryable failures (including a
+        request running past LLM_REQUEST_TIMEOUT) are retried up to
+        LLM_MAX_ATTEMPTS attempts with backoff; other errors are raised
+        right away.
+        """
+        for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+            try:
+                return await self.send_hedged(prompt, config)
+            except Exception as e:
+                if attempt == LLM_MAX_ATTEMPTS or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("LLM request failed (%s); retrying in %.1fs", str(e)[:50] or type(e).__name__, delay)
+                await asyncio.sleep(delay)
+    
+    async def send_hedged(self, prompt: str, config: Dict) -> str:
+        """Send a request, racing a duplicate against it if it runs unusually long.
+        
+        The first successful response wins and the other request is
+        cancelled. An error is raised only once no request is left running.
+        The hedge timer starts once the first request has its rate-limit
+        token, so time spent queueing does not trigger a hedge.
+        """
+        await self.rate_limiter.acquire()
+        hedge_after = self.hedge_delay()
+        pending = {asyncio.ensure_future(self.post_request(prompt, config))}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, timeout=hedge_after,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than 95% of recent requests: send a hedge once
+                    pending.add(asyncio.ensure_future(self.send_request(prompt, config)))
+                    hedge_after = None
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    return done.pop().result()  # re-raises the failure
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def hedge_delay(self) -> Optional[float]:
+        """95th percentile of recent request latencies, or None while there are too few."""
+        if len(self.request_latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self.request_latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+    
+    async def send_request(self, prompt: str, config: Dict) -> str:
+        """Send one rate-limited request and return the response text.
+        
+        All requests go through the backend's one client, whose HTTP
+        connections are pooled and kept alive across the run.
+        """
+        await self.rate_limiter.acquire()
+        return await self.post_request(prompt, config)
+    
+    async def post_request(self, prompt: str, config: Dict) -> str:
+        """Send one request whose rate-limit token is already acquired.
+        
+        Only the call itself is limited to LLM_REQUEST_TIMEOUT seconds and
+        timed for hedge_delay(), so waiting for a token counts toward neither.
+        """
+        # Counted when sent, so failed attempts and hedges show up as quota use
+        self.requests_sent += 1
+        started = time.monotonic()
+        response = await asyncio.wait_for(
+            self.client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=config
+            ),
+            LLM_REQUEST_TIMEOUT
+        )
+        self.request_latencies.append(time.monotonic() - started)
+        return response.text
+
+
+class RulesOnlyBackend:
+    """Stand-in for GeminiBackend when Gemini is unavailable: nothing is sent.
+    
+    It only carries the `enabled` flag and the request count. Callers check
+    `enabled` (run_llm_batches() once per block) and resolve every
+    owner/device field with the rules fallback instead of sending anything.
+    """
+    enabled = False
+    requests_sent = 0
+
+
+def make_llm_backend():
+    """GeminiBackend if google-genai is installed and configures, else RulesOnlyBackend."""
+    if not HAS_GEMINI:
+        print("Warning: google-genai package not installed. Install with: pip install google-genai")
+        print(" LLM-based classification will be skipped. Using rules-only approach.\n")
+        return RulesOnlyBackend()
+    try:
+        return GeminiBackend()
+    except Exception as e:
+        print(f"Warning: Could not configure Gemini API: {e}")
+        print("Make sure GEMINI_API_KEY environment variable is set.\n")
+        return RulesOnlyBackend()
+
 
 class DataNormalizer:
-    def __init__(self, input_csv: str):
+    def __init__(self, input_csv: str, rules_only: bool = False):
         self.input_csv = input_csv
         self.anomalies = []
-        self.llm_calls_log = []
+        # Call log bucketed by purpose as it is recorded, with the number of
+        # entries per purpose that cost an actual LLM call
+        self.llm_calls_log_by_purpose = defaultdict(LLMLog)
+        self.llm_call_counts = defaultdict(int)
+        # Chosen once; the LLM code paths only go through this object.
+        # Without an LLM backend (or with rules_only) the LLM cache is not
+        # loaded either, so no cached answer reaches a row unlogged.
+        self.backend = RulesOnlyBackend() if rules_only else make_llm_backend()
+        self.llm_cache = self.load_llm_cache() if self.backend.enabled else {}
+        self.new_cache_entries = {}
+        self.llm_cache_hits = 0
+        self.rows_processed = 0
+    
+    @property
+    def llm_calls_log(self) -> List[Dict]:
+        """Every call log entry as a dict, one purpose after another."""
+        return [
+            entry
+            for purpose, log in self.llm_calls_log_by_purpose.items()
+            for entry in log.entries(purpose)
+        ]
         
     # ==================== IP VALIDATION (RULES ONLY) ====================
     
-    def ipv4_validate_and_normalize(self, ip_str: str) -> Tuple[bool, str, str, str]:
-        """Validate and normalize IPv4 addresses using deterministic rules."""
-        if not ip_str or ip_str.strip().upper() in ("N/A", ""):
-            return (False, ip_str, "", "missing")
+    def ipv4_validate_and_normalize(self, ip_str: str) -> Tuple[bool, str, str, str, Optional[bytes]]:
+        """Validate and normalize an already-stripped IPv4 address using deterministic rules.
         
-        s = str(ip_str).strip()
+        Valid addresses also return their 4 packed octets, which the subnet
+        and reverse PTR helpers use directly instead of re-splitting.
+        """
+        s = ip_str
+        if not s or s.upper() == "N/A":
+            return (False, s, "", "missing", None)
         
         # Check for IPv6
         if ":" in s or "%" in s:
-            return (False, s, "6", "ipv6_detected")
+            return (False, s, "6", "ipv6_detected", None)
         
         # Split by dots
         parts = s.split(".")
         if len(parts) != 4:
-            return (False, s, "", "wrong_part_count")
+            return (False, s, "", "wrong_part_count", None)
+        
+        # Fast path for plain ASCII digits: bytes() parses and range-checks the
+        # octets in C. Leading zeros are decimal here ("010" -> 10), whereas
+        # socket.inet_aton would read them as octal, so it only formats.
+        if s.isascii() and s.replace(".", "").isdigit():
+            try:
+                packed = bytes(map(int, parts))
+                return (True, socket.inet_ntoa(packed), "4", "ok", packed)
+            except ValueError:
+                pass  # empty or out-of-range octet, diagnosed below
         
         canonical_parts = []
         for p in parts:
             if p == "":
-                return (False, s, "", "empty_octet")
+                return (False, s, "", "empty_octet", None)
             
             # Check for negative
             if p.startswith("-"):
-                return (False, s, "", "negative_octet")
+                return (False, s, "", "negative_octet", None)
             
             # Check for non-numeric
             if not p.isdigit():
-                return (False, s, "", "non_numeric_octet")
+                return (False, s, "", "non_numeric_octet", None)
             
             try:
                 v = int(p, 10)
             except ValueError:
-                return (False, s, "", "parse_error")
+                return (False, s, "", "parse_error", None)
             
             if v < 0 or v > 255:
-                return (False, s, "", "octet_out_of_range")
+                return (False, s, "", "octet_out_of_range", None)
             
-            canonical_parts.append(str(v))
+            canonical_parts.append(v)
         
-        canonical = ".".join(canonical_parts)
-        return (True, canonical, "4", "ok")
-    
-    def classify_ipv4_type(self, ip: str) -> str:
-        """Classify IPv4 address type."""
-        try:
-            octets = list(map(int, ip.split(".")))
-            
-            if octets[0] == 10:
-                return "private_rfc1918"
-            if octets[0] == 172 and 16 <= octets[1] <= 31:
-                return "private_rfc1918"
-            if octets[0] == 192 and octets[1] == 168:
-                return "private_rfc1918"
-            if octets[0] == 169 and octets[1] == 254:
-                return "link_local_apipa"
-            if octets[0] == 127:
-                return "loopback"
-            
-            return "public_or_other"
-        except:
-            return "unknown"
-    
-    def default_subnet(self, ip: str) -> str:
-        """Generate default subnet CIDR."""
-        iptype = self.classify_ipv4_type(ip)
-        if iptype == "private_rfc1918":
-            parts = list(map(int, ip.split(".")))
-            return f"{parts[0]}.{parts[1]}.{parts[2]}.0/24"
-        return ""
+        packed = bytes(canonical_parts)
+        return (True, socket.inet_ntoa(packed), "4", "ok", packed)
     
     # ==================== HOSTNAME VALIDATION (RULES ONLY) ====================
     
     def validate_hostname(self, hostname: str) -> Tuple[bool, str]:
-        """Validate hostname per RFC standards."""
-        if not hostname or hostname.strip() == "":
+        """Validate an already-stripped hostname per RFC standards."""
+        h = hostname
+        if not h:
             return (False, "missing")
         
-        h = hostname.strip()
-        
         # RFC 1123: alphanumeric and hyphens, start with alphanumeric
         # Max 63 chars per label, 253 total
         if len(h) > 253:
             return (False, "too_long")
         
         # Check valid characters
-        pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?$'
-        if not re.match(pattern, h):
+        if not is_valid_label(h):
             return (False, "invalid_format")
         
         return (True, "ok")
     
     def validate_fqdn(self, fqdn: str) -> Tuple[bool, str]:
-        """Validate FQDN."""
-        if not fqdn or fqdn.strip() == "":
+        """Validate an already-stripped FQDN."""
+        f = fqdn
+        if not f:
             return (False, "missing")
         
-        f = fqdn.strip()
-        
         # Must have at least one dot
         if "." not in f:
             return (False, "missing_domain")
@@ -136,140 +799,114 @@ class DataNormalizer:
         for label in labels:
             if len(label) > 63 or len(label) == 0:
                 return (False, "invalid_label_length")
-            if not re.match(r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?$', label):
+            if not is_valid_label(label):
                 return (False, "invalid_label_format")
         
         return (True, "ok")
     
+    def _fqdn_pair_consistent(self, pair: Tuple[str, str]) -> bool:
+        """check_fqdn_consistency() over a (hostname, fqdn) pair, for map_column."""
+        return self.check_fqdn_consistency(*pair)
+    
     def check_fqdn_consistency(self, hostname: str, fqdn: str) -> bool:
         """Check if FQDN starts with hostname."""
         if not hostname or not fqdn:
             return False
         return fqdn.lower().startswith(hostname.lower() + ".")
     
-    def generate_reverse_ptr(self, ip: str, ip_valid: bool) -> str:
-        """Generate reverse PTR record."""
-        if not ip_valid:
-            return ""
-        try:
-            octets = ip.split(".")
-            return f"{octets[3]}.{octets[2]}.{octets[1]}.{octets[0]}.in-addr.arpa"
-        except:
-            return ""
-    
     # ==================== MAC ADDRESS VALIDATION (RULES ONLY) ====================
     
     def normalize_mac(self, mac: str) -> Tuple[bool, str, str]:
-        """Normalize MAC address to standard format."""
-        if not mac or mac.strip() == "":
+        """Normalize an already-stripped MAC address to standard format."""
+        m = mac
+        if not m:
             return (False, "", "missing")
         
-        m = mac.strip()
-        
         # Remove common separators
-        cleaned = re.sub(r'[-:.]', '', m)
+        cleaned = m.translate(_MAC_STRIP)
         
-        # Check if valid hex and correct length
-        if not re.match(r'^[0-9A-Fa-f]{12}$', cleaned):
+        # Must be exactly 12 hex digits (bytes.fromhex would skip whitespace)
+        if len(cleaned) != 12:
+            return (False, m, "invalid_format")
+        try:
+            octets = bytes.fromhex(cleaned)
+        except ValueError:
+            return (False, m, "invalid_format")
+        if len(octets) != 6:
             return (False, m, "invalid_format")
         
         # Normalize to colon-separated lowercase
-        normalized = ":".join([cleaned[i:i+2].lower() for i in range(0, 12, 2)])
-        return (True, normalized, "ok")
+        return (True, _MAC_FMT.format(*octets), "ok")
     
     # ==================== OWNER PARSING (LLM-BASED) ====================
     
-    def parse_owner_llm(self, owner: str, row_id: str) -> Tuple[str, str, str]:
-        """Parse owner field using LLM for complex/ambiguous cases."""
-        if not owner or owner.strip() == "":
-            return ("", "", "")
-        
-        o = owner.strip()
+    async def parse_owner_batch(self, batch: List[Tuple[str, str]]) -> Optional[Tuple[List[Optional[Tuple[str, str, str]]], List[LLMLogEntry], List[Optional[Dict]]]]:
+        """Parse one batch of (row_id, owner) pairs with a single LLM call.
         
-        # Use LLM for all owner parsing if available
-        if HAS_GEMINI:
-            print(f"    Row {row_id}: Attempting LLM owner parsing...", end="", flush=True)
-            try:
-                prompt = f"""Parse the owner information from this text into structured fields.
-
-Owner text: "{o}"
-
-IMPORTANT INSTRUCTIONS:
-1. If the text is a PROPER NOUN (person's name like "John", "Priya", "Jane"), put it in "name"
-2. If the text is a COMMON NOUN (team/department like "ops", "platform", "security", "facilities"), put it in "team"
-3. Extract any email addresses found
-4. A team in parentheses like "(engineering)" goes in "team"
-
-Examples:
-
-Input: "priya (platform) priya@corp.example.com"
-Output: {{"name": "priya", "email": "priya@corp.example.com", "team": "platform"}}
-(Person name + team + email)
-
-Input: "ops"
-Output: {{"name": "", "email": "", "team": "ops"}}
-(Common noun = team, not a person name)
-
-Input: "platform"
-Output: {{"name": "", "email": "", "team": "platform"}}
-(Common noun = team, not a person name)
-
-Input: "Facilities"
-Output: {{"name": "", "email": "", "team": "Facilities"}}
-(Department/team, not a person)
-
-Input: "jane@corp.example.com"
-Output: {{"name": "jane", "email": "jane@corp.example.com", "team": ""}}
-(Email provides the name)
-
-Input: "sec"
-Output: {{"name": "", "email": "", "team": "sec"}}
-(Short for security team)
-
-Extract and return:
-- name: Person's name (empty string if the text is a team/department)
-- email: Email address (empty string if not present)
-- team: Team/department name (empty string if the text is a person's name)
-
-Respond ONLY with valid JSON, no additional text."""
+        Returns the parsed (name, email, team) tuples, the call log
+        (fields, prompt digest, response) tuples and the raw response
+        objects for the batch, or None if the LLM call fails (the caller then
+        falls back to regex). Owners missing from the response get None in
+        place of their tuple and raw object. Runs as one of the concurrent
+        tasks of run_llm_batches().
+        """
+        rows_label = f"{batch[0][0]}-{batch[-1][0]}"
+        try:
+            # Entries carry their position in the batch as "id" so the
+            # response can be matched back even if reordered or incomplete
+            owner_texts = dump_json_line([{"id": idx, "owner": o} for idx, (_, o) in enumerate(batch)]).decode("utf-8")
+            prompt = f"Owner texts: {owner_texts}"
 
-                response = client.models.generate_content(
-                    model='gemini-3-flash-preview',
-                    contents=prompt,
-                    config={
-                        'temperature': 0.1,
-                        'response_mime_type': 'application/json'
-                    }
-                )
-                
-                result = json.loads(response.text)
-                
-                name = result.get("name", "")
-                email = result.get("email", "")
-                team = result.get("team", "")
-                
-                print(f" ✓")
-                
-                self.llm_calls_log.append({
-                    "purpose": "owner_parsing",
-                    "prompt": prompt,
-                    "response": response.text,
-                    "parsed_name": name,
-                    "parsed_email": email,
-                    "parsed_team": team,
-                    "source_row_id": row_id
-                })
-                
-                return (name, email, team)
-                
-            except Exception as e:
-                print(f" ✗ Failed: {str(e)[:50]}...")
-                print(f"       Falling back to regex for row {row_id}")
-                # Fall through to regex fallback below
+            response_text = await self.backend.generate_json(prompt, _OWNER_REQUEST_CONFIG)
+            
+            try:
+                result = scatter_by_id(load_json(response_text), len(batch))
+                parsed = [
+                    (item.get("name", ""), item.get("email", ""), item.get("team", "")) if item is not None else None
+                    for item in result
+                ]
+            except (ValueError, TypeError, AttributeError) as e:
+                return await self.retry_in_halves(self.parse_owner_batch, batch, "owner parsing", e)
+            
+            logger.info("Rows %s: LLM owner parsing (%d rows)... ✓", rows_label, len(batch))
+            
+            # The prompt text is documented once in prompts.md; each entry
+            # only keeps a digest of it
+            prompt_sha1 = prompt_digest(prompt)
+            
+            log_entries = [(owner, prompt_sha1, response_text) for owner in parsed if owner is not None]
+            
+            return (parsed, log_entries, result)
+            
+        except Exception as e:
+            logger.warning("Rows %s: LLM owner parsing (%d rows) failed: %s; falling back to regex",
+                           rows_label, len(batch), str(e)[:50])
+        
+        # LLM call failed; run_llm_batches applies the regex fallback
+        return None
+    
+    def parse_owner_fast(self, o: str) -> Optional[Tuple[str, str, str]]:
+        """Parse owner fields that are unambiguous without the LLM.
         
-        # Fallback ONLY if LLM not available or failed
-        email_match = re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', o)
-        team_match = re.search(r'\(([^)]+)\)', o)
+        A bare email gives the name from its local part, a known team name
+        from _OWNER_TEAMS is a team, and a one-word name equal to the local part of the email
+        next to it (optionally with a "(team)") is taken as that person.
+        Returns None when the text needs the LLM.
+        """
+        if _EMAIL_RE.fullmatch(o):
+            return (o.split("@", 1)[0], o, "")
+        if o in _OWNER_TEAMS:
+            return ("", "", o)
+        if "@" in o:
+            name, email, team = self.parse_owner_rules(o)
+            if email and name.isalpha() and name.lower() == email.split("@", 1)[0].lower():
+                return (name, email, team)
+        return None
+    
+    def parse_owner_rules(self, o: str) -> Tuple[str, str, str]:
+        """Parse a non-empty owner field with regexes (fallback when the LLM is unavailable)."""
+        email_match = _EMAIL_RE.search(o)
+        team_match = _TEAM_PAREN_RE.search(o)
         
         email = email_match.group(0) if email_match else ""
         team = team_match.group(1).strip() if team_match else ""
@@ -285,282 +922,576 @@ Respond ONLY with valid JSON, no additional text."""
     # ==================== SITE NORMALIZATION (RULES ONLY) ====================
     
     def normalize_site(self, site: str) -> str:
-        """Normalize site names using rules for consistency."""
-        if not site or site.strip().upper() in ("N/A", ""):
+        """Normalize an already-stripped site name using rules for consistency."""
+        if not site or site.upper() == "N/A":
             return ""
         
-        s = site.strip()
-        
-        # First, normalize separators (convert hyphens/underscores to spaces for processing)
-        s = re.sub(r'[-_]+', ' ', s)
+        # Separators/whitespace -> single space, abbreviations (case-insensitive)
+        # -> canonical form, and a space between letters and numbers, in one pass
+        return _SITE_FUSED_RE.sub(_site_repl, site).strip()
+    
+    # ==================== DEVICE TYPE CLASSIFICATION (LLM-BASED) ====================
+    
+    async def classify_device_batch(self, batch: List[Tuple[str, str, str, str]]) -> Optional[Tuple[List[Optional[Tuple[str, str]]], List[LLMLogEntry], List[Optional[Dict]]]]:
+        """Classify one batch of (row_id, hostname, notes, ip) tuples with a single LLM call.
         
-        # Normalize multiple spaces to single
-        s = re.sub(r'\s+', ' ', s)
+        Returns the (device_type, confidence) tuples, the call log
+        (fields, prompt digest, response) tuples and the raw response
+        objects for the batch, or None if the LLM call fails (the caller then
+        falls back to keyword rules). Devices missing from the response get
+        None in place of their tuple and raw object. Runs as one of the
+        concurrent tasks of run_llm_batches().
+        """
+        rows_label = f"{batch[0][0]}-{batch[-1][0]}"
+        try:
+            devices = dump_json_line([
+                {
+                    "id": idx,
+                    "hostname": hostname if hostname else 'N/A',
+                    "notes": notes if notes else 'N/A',
+                    "ip": ip_addr if ip_addr else 'N/A'
+                }
+                for idx, (_, hostname, notes, ip_addr) in enumerate(batch)
+            ]).decode("utf-8")
+            prompt = f"Devices: {devices}"
+
+            response_text = await self.backend.generate_json(prompt, _DEVICE_REQUEST_CONFIG)
+            
+            try:
+                result = scatter_by_id(load_json(response_text), len(batch))
+                parsed = [
+                    (item.get("device_type", "unknown").lower(), item.get("confidence", 0.0), item.get("reasoning", ""))
+                    if item is not None else None
+                    for item in result
+                ]
+                
+                # Confidence level based on LLM score
+                classified = [
+                    (device[0], "medium" if device[1] >= 0.8 else "low") if device is not None else None
+                    for device in parsed
+                ]
+            except (ValueError, TypeError, AttributeError) as e:
+                return await self.retry_in_halves(self.classify_device_batch, batch, "device classification", e)
+            
+            logger.info("Rows %s: LLM device classification (%d rows)... ✓", rows_label, len(batch))
+            
+            prompt_sha1 = prompt_digest(prompt)
+            
+            log_entries = [(device, prompt_sha1, response_text) for device in parsed if device is not None]
+            
+            return (classified, log_entries, result)
+            
+        except Exception as e:
+            logger.warning("Rows %s: LLM device classification (%d rows) failed: %s; using keyword fallback",
+                           rows_label, len(batch), str(e)[:50])
         
-        # Normalize common abbreviations (case-insensitive)
-        s = re.sub(r'\b(bldg|building)\b', 'Building', s, flags=re.IGNORECASE)
-        s = re.sub(r'\b(campus)\b', 'Campus', s, flags=re.IGNORECASE)
-        s = re.sub(r'\b(hq)\b', 'HQ', s, flags=re.IGNORECASE)
-        s = re.sub(r'\b(lab)\b', 'Lab', s, flags=re.IGNORECASE)
-        s = re.sub(r'\b(dc)\b', 'DC', s, flags=re.IGNORECASE)
+        # LLM call failed; run_llm_batches applies the keyword fallback
+        return None
+    
+    async def retry_in_halves(self, fn, batch: List[Tuple], purpose_label: str, error: Exception) -> Optional[Tuple[List, List[LLMLogEntry], List]]:
+        """Re-send a batch whose response could not be parsed as two half batches.
         
-        # Standardize spacing around numbers (e.g., "Building1" -> "Building 1")
-        s = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', s)
+        The halves are sent one after the other, under the caller's
+        concurrency slot. Results are combined in batch order, with None for
+        the rows of a half that failed. A single row is not retried.
+        """
+        rows_label = f"{batch[0][0]}-{batch[-1][0]}"
+        if len(batch) == 1:
+            logger.warning("Rows %s: LLM %s response unusable: %s; using rules fallback",
+                           rows_label, purpose_label, str(error)[:50])
+            return None
+        logger.warning("Rows %s: LLM %s response unusable: %s; retrying as two smaller batches",
+                       rows_label, purpose_label, str(error)[:50])
         
-        # Final cleanup: remove extra spaces
-        s = re.sub(r'\s+', ' ', s).strip()
+        middle = len(batch) // 2
+        results, log_entries, raw_items = [], [], []
+        for half in (batch[:middle], batch[middle:]):
+            half_result = await fn(half)
+            if half_result is None:
+                results += [None] * len(half)
+                raw_items += [None] * len(half)
+            else:
+                results += half_result[0]
+                log_entries += half_result[1]
+                raw_items += half_result[2]
+        return (results, log_entries, raw_items)
+    
+    def classify_device_type_rules(self, hostname: str, notes: str) -> Tuple[str, str]:
+        """Classify device type from hostname/notes keywords (fallback when the LLM is unavailable)."""
+        clues = (hostname + " " + notes).lower()
         
-        return s
+        # Substring scans (C-level str.__contains__) in priority order,
+        # stopping at the first type with a hit
+        contains = clues.__contains__
+        for device_type, keywords in _DEVICE_KEYWORDS:
+            if any(map(contains, keywords)):
+                return (device_type, "medium")
+        return ("unknown", "low")
     
-    # ==================== DEVICE TYPE CLASSIFICATION (LLM-BASED) ====================
+    # ==================== LLM DISPATCH ====================
     
-    def classify_device_type_llm(self, row_data: Dict[str, str]) -> Tuple[str, str]:
-        """Classify device type using LLM for all ambiguous cases."""
+    async def run_llm_batches(self, owner_items: List[Tuple[str, str]],
+                        device_items: List[Tuple[str, str, str, str]]) -> Tuple[List, List]:
+        """Resolve owner and device fields via the cache and concurrent LLM batches.
         
-        device_type = row_data.get("device_type", "").strip().lower()
-        hostname = row_data.get("hostname", "").strip()
-        notes = row_data.get("notes", "").strip()
-        ip_addr = row_data.get("ip", "").strip()
+        Returns both result lists in input order. Each distinct input is sent to
+        the LLM at most once; inputs whose batch failed (or every input, when
+        the LLM is unavailable) use the rules fallback.
+        """
+        owner_keys = [llm_cache_key("owner_parsing", owner_cache_key(o)) for _, o in owner_items]
+        device_keys = [
+            llm_cache_key("device_type_classification", device_cache_key(hostname, notes, ip_addr))
+            for _, hostname, notes, ip_addr in device_items
+        ]
         
-        # If device_type is explicitly provided and valid, use it (high confidence)
-        known_types = ["server", "router", "switch", "printer", "iot", "firewall", "access point", "workstation"]
-        if device_type in known_types:
-            return (device_type, "high")
+        tasks = []
+        cached = []  # (purpose, key) of distinct inputs already in the cache
+        row_ids_by_key = {}
+        if self.backend.enabled:
+            for purpose, fn, items, keys in (
+                ("owner_parsing", self.parse_owner_batch, owner_items, owner_keys),
+                ("device_type_classification", self.classify_device_batch, device_items, device_keys)
+            ):
+                todo_items, todo_keys, cached_keys, row_ids = self._group_by_key(items, keys)
+                row_ids_by_key.update(row_ids)
+                cached += [(purpose, key) for key in cached_keys]
+                tasks += [
+                    (purpose, fn, todo_items[start:start + LLM_BATCH_SIZE], todo_keys[start:start + LLM_BATCH_SIZE])
+                    for start in range(0, len(todo_items), LLM_BATCH_SIZE)
+                ]
         
-        # For everything else (empty or unknown device_type), use LLM if available
-        if HAS_GEMINI:
-            print(f"    Row {row_data.get('source_row_id')}: Attempting LLM device classification...", end="", flush=True)
-            try:
-                prompt = f"""Classify this network device type based on the information provided.
-
-Hostname: {hostname if hostname else 'N/A'}
-Notes: {notes if notes else 'N/A'}
-IP Address: {ip_addr if ip_addr else 'N/A'}
-
-IMPORTANT INSTRUCTIONS:
-- Analyze the hostname patterns and notes carefully
-- If there is clear evidence (hostname contains srv, sw, rtr, etc. OR notes describe the device), classify it
-- If there is NO clear supporting information to determine the device type, respond with "unknown"
-- Do NOT guess if the information is insufficient
-
-Common patterns to look for:
-- Servers: srv, host, db, web, app, sql
-- Routers: rtr, router, gw, gateway, edge
-- Switches: sw, switch, core
-- Printers: print, printer
-- IoT devices: cam, camera, iot, sensor
-- Access Points: ap, wireless, wifi
-- Firewalls: fw, firewall
-
-Respond with a JSON object:
-{{"device_type": "server", "confidence": 0.85, "reasoning": "Brief explanation of why you chose this classification"}}
-
-Valid device types: server, router, switch, printer, iot, firewall, access point, workstation, unknown
-
-If uncertain or no clear indicators exist, use device_type: "unknown" with low confidence."""
-
-                response = client.models.generate_content(
-                    model='gemini-3-flash-preview',
-                    contents=prompt,
-                    config={
-                        'temperature': 0.1,
-                        'response_mime_type': 'application/json'
-                    }
-                )
-                
-                result = json.loads(response.text)
-                
-                classification = result.get("device_type", "unknown").lower()
-                confidence_score = result.get("confidence", 0.0)
-                reasoning = result.get("reasoning", "")
-                
-                print(f" ✓ {classification}")
-                
-                self.llm_calls_log.append({
-                    "purpose": "device_type_classification",
-                    "prompt": prompt,
-                    "response": response.text,
-                    "classification": classification,
-                    "confidence": confidence_score,
-                    "reasoning": reasoning,
-                    "source_row_id": row_data.get("source_row_id")
-                })
-                
-                # Confidence level based on LLM score
-                if confidence_score >= 0.8:
-                    conf_level = "medium"
-                else:
-                    conf_level = "low"
-                
-                return (classification, conf_level)
-                
-            except Exception as e:
-                print(f" ✗ Failed: {str(e)[:50]}...")
-                print(f"       API error for row {row_data.get('source_row_id')}, using fallback")
-            
-                pass
+        # All batches are started at once; the semaphore bounds how many
+        # requests are in flight
+        semaphore = asyncio.Semaphore(LLM_MAX_WORKERS)
+        
+        async def run_task(fn, batch):
+            async with semaphore:
+                return await fn(batch)
+        
+        task_results = await asyncio.gather(
+            *(run_task(fn, batch) for _, fn, batch, _ in tasks),
+            return_exceptions=True
+        )
+        
+        # Record in task order so the cache and the call log stay deterministic
+        for (purpose, _, _, keys), task_result in zip(tasks, task_results):
+            if task_result is None or isinstance(task_result, BaseException):
+                continue
+            results, log_entries, raw_items = task_result
+            # Log entries exist, in batch order, for the inputs that got a result
+            log = self.llm_calls_log_by_purpose[purpose]
+            log_entry_iter = iter(log_entries)
+            for key, result, raw in zip(keys, results, raw_items):
+                if result is None:
+                    continue  # left out of the response; use the rules fallback
+                affected_row_ids = row_ids_by_key[key]
+                fields, prompt_sha1, response_text = next(log_entry_iter)
+                log.append(affected_row_ids, fields, prompt_sha1=prompt_sha1, response=response_text)
+                self.llm_cache_hits += len(affected_row_ids) - 1
+                entry = {"result": tuple(result), "raw": raw}
+                self.llm_cache[key] = entry
+                self.new_cache_entries[key] = entry
+            self.llm_call_counts[purpose] += len(log_entries)
         
+        # Cached inputs are logged too (flagged cache_hit, they cost no request)
+        for purpose, key in cached:
+            affected_row_ids = row_ids_by_key[key]
+            self.llm_cache_hits += len(affected_row_ids)
+            self.llm_calls_log_by_purpose[purpose].append(
+                affected_row_ids, self._cache_hit_log_fields(purpose, self.llm_cache[key]), cache_hit=True
+            )
+        
+        owner_results = [
+            self._cached_result(key) or self.parse_owner_rules(o)
+            for (_, o), key in zip(owner_items, owner_keys)
+        ]
+        device_results = [
+            self._cached_result(key) or self.classify_device_type_rules(hostname, notes)
+            for (_, hostname, notes, _), key in zip(device_items, device_keys)
+        ]
+        
+        return (owner_results, device_results)
     
-        # This should only run if API is properly configured
-        clues = (hostname + " " + notes).lower()
+    def _group_by_key(self, items: List[Tuple], keys: List[str]) -> Tuple[List[Tuple], List[str], List[str], Dict[str, List[str]]]:
+        """Group (row_id, ...) items by cache key.
         
-        if any(x in clues for x in ["srv", "server", "db", "host", "sql", "web", "app"]):
-            return ("server", "medium")
-        if any(x in clues for x in ["rtr", "router", "gw", "gateway", "edge"]):
-            return ("router", "medium")
-        if any(x in clues for x in ["sw", "switch", "core"]):
-            return ("switch", "medium")
-        if any(x in clues for x in ["print", "printer"]):
-            return ("printer", "medium")
-        if any(x in clues for x in ["cam", "camera", "iot", "sensor"]):
-            return ("iot", "medium")
-        if any(x in clues for x in ["ap", "access", "wireless", "wifi"]):
-            return ("access point", "medium")
-        if any(x in clues for x in ["fw", "firewall"]):
-            return ("firewall", "medium")
-        if any(x in clues for x in ["pc", "laptop", "desktop", "workstation"]):
-            return ("workstation", "medium")
+        Returns the first item of each key that is not cached yet (with its
+        key), the keys that are already cached, and the row ids per key.
+        """
+        todo_items, todo_keys, cached_keys, row_ids = [], [], [], {}
+        for item, key in zip(items, keys):
+            if key in row_ids:
+                row_ids[key].append(item[0])
+                continue
+            row_ids[key] = [item[0]]
+            if key in self.llm_cache:
+                cached_keys.append(key)
+            else:
+                todo_items.append(item)
+                todo_keys.append(key)
+        return (todo_items, todo_keys, cached_keys, row_ids)
+    
+    def _cached_result(self, key: str) -> Optional[Tuple]:
+        """Cached LLM result for a key, or None."""
+        cached = self.llm_cache.get(key)
+        return cached["result"] if cached is not None else None
+    
+    def _cache_hit_log_fields(self, purpose: str, cached: Dict) -> Tuple:
+        """Call log fields (in _LOG_FIELDS order) for an input answered from the cache."""
+        if purpose == "owner_parsing":
+            return tuple(cached["result"])
+        raw = cached["raw"]
+        return (cached["result"][0], raw.get("confidence", 0.0), raw.get("reasoning", ""))
+    
+    # ==================== LLM CACHE ====================
+    
+    def load_llm_cache(self) -> Dict[str, Dict]:
+        """Load LLM results persisted by earlier runs.
         
-        return ("unknown", "low")
+        Each line holds one {"key", "result", "raw"} object, where key is the
+        llm_cache_key() of the input and raw the model's object for it.
+        """
+        cache = {}
+        if LLM_CACHE_FILE and os.path.exists(LLM_CACHE_FILE):
+            with open(LLM_CACHE_FILE, "rb") as f:
+                for line in f:
+                    try:
+                        entry = load_json(line)
+                        cache[entry["key"]] = {"result": tuple(entry["result"]), "raw": dict(entry["raw"])}
+                    except (ValueError, KeyError, TypeError):
+                        continue  # skip a truncated, malformed or old-format line
+        return cache
+    
+    def save_llm_cache(self):
+        """Append the LLM results obtained in this run to the cache file."""
+        if not LLM_CACHE_FILE or not self.new_cache_entries:
+            return
+        with open(LLM_CACHE_FILE, "ab", buffering=OUTPUT_WRITE_BUFFER) as f:
+            f.writelines(
+                dump_json_line({"key": key, "result": list(entry["result"]), "raw": entry["raw"]}) + b"\n"
+                for key, entry in self.new_cache_entries.items()
+            )
+        self.new_cache_entries = {}
     
     # ==================== MAIN PROCESSING ====================
     
-    def process(self):
-        """Main processing pipeline."""
-        output_rows = []
+    def apply_rules(self, columns: Dict[str, int], block: List[List[str]]) -> Tuple[List[RuleRecord], List[Dict]]:
+        """Run the rules-only stages over a block of input rows.
+        
+        Rows are positional lists; columns maps each header name to its
+        position. Returns one RuleRecord (holding a partial output row) per
+        row, plus the block's anomalies. Owner and device fields that need
+        context are left for the LLM pass.
+        """
+        records = []
+        anomalies = []
         
-        with open(self.input_csv, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        def column(name):
+            # Raw values, "" for a column missing from the header or a short row
+            pos = columns.get(name)
+            if pos is None:
+                return [""] * len(block)
+            return [row[pos] if pos < len(row) else "" for row in block]
+        
+        # Every field is stripped exactly once here; the validators and the
+        # output row all work on these stripped values. Anomalies report the
+        # raw ones.
+        row_ids = column("source_row_id")
+        raw_ips = column("ip")
+        raw_hostnames = column("hostname")
+        raw_fqdns = column("fqdn")
+        raw_macs = column("mac")
+        ips = [value.strip() for value in raw_ips]
+        hostnames = [value.strip() for value in raw_hostnames]
+        fqdns = [value.strip() for value in raw_fqdns]
+        macs = [value.strip() for value in raw_macs]
+        owners = [value.strip() for value in column("owner")]
+        device_types = [value.strip() for value in column("device_type")]
+        sites = [value.strip() for value in column("site")]
+        notes_column = [value.strip() for value in column("notes")]
+        
+        # Rules-only fields are computed a column at a time, once per distinct value
+        ip_results = map_column(self.ipv4_validate_and_normalize, ips)
+        hostname_results = map_column(self.validate_hostname, hostnames)
+        fqdn_results = map_column(self.validate_fqdn, fqdns)
+        mac_results = map_column(self.normalize_mac, macs)
+        site_results = map_column(self.normalize_site, sites)
+        owner_fast_results = map_column(self.parse_owner_fast, owners)
+        known_device_types = map_column(lookup_device_type, device_types)
+        fqdn_consistency = map_column(self._fqdn_pair_consistent, list(zip(hostnames, fqdns)))
+        
+        for idx, row_id in enumerate(row_ids):
+            steps = []
+            row_anomalies = []
             
-            for row in reader:
-                row_id = row.get("source_row_id", "")
-                steps = []
-                row_anomalies = []
-                
-                # 1. IP Validation (RULES ONLY)
-                raw_ip = row.get("ip", "")
-                ip_valid, ip_normalized, ip_version, ip_reason = self.ipv4_validate_and_normalize(raw_ip)
-                steps.append("ip_trim")
-                
-                if ip_valid:
-                    steps.append("ip_parse")
-                    steps.append("ip_normalize")
-                    subnet_cidr = self.default_subnet(ip_normalized)
-                    reverse_ptr = self.generate_reverse_ptr(ip_normalized, True)
-                else:
-                    steps.append(f"ip_invalid_{ip_reason}")
-                    subnet_cidr = ""
-                    reverse_ptr = ""
+            # 1. IP Validation (RULES ONLY)
+            ip = ips[idx]
+            ip_valid, ip_normalized, ip_version, ip_reason, ip_octets = ip_results[idx]
+            steps.append("ip_trim")
+            
+            if ip_valid:
+                steps.append("ip_parse")
+                steps.append("ip_normalize")
+                subnet_cidr = default_subnet(ip_octets)
+                reverse_ptr = generate_reverse_ptr(ip_octets)
+            else:
+                steps.append(f"ip_invalid_{ip_reason}")
+                subnet_cidr = ""
+                reverse_ptr = ""
+                row_anomalies.append({
+                    "field": "ip",
+                    "type": ip_reason,
+                    "value": raw_ips[idx]
+                })
+            
+            # 2. Hostname Validation (RULES ONLY)
+            hostname = hostnames[idx]
+            hostname_valid, hostname_reason = hostname_results[idx]
+            steps.append("hostname_trim")
+            
+            if hostname_valid:
+                steps.append("hostname_validate")
+            else:
+                steps.append(f"hostname_invalid_{hostname_reason}")
+                if hostname:
                     row_anomalies.append({
-                        "field": "ip",
-                        "type": ip_reason,
-                        "value": raw_ip
+                        "field": "hostname",
+                        "type": hostname_reason,
+                        "value": raw_hostnames[idx]
                     })
-                
-                # 2. Hostname Validation (RULES ONLY)
-                raw_hostname = row.get("hostname", "")
-                hostname_valid, hostname_reason = self.validate_hostname(raw_hostname)
-                steps.append("hostname_trim")
-                
-                if hostname_valid:
-                    steps.append("hostname_validate")
-                    hostname_out = raw_hostname.strip()
-                else:
-                    steps.append(f"hostname_invalid_{hostname_reason}")
-                    hostname_out = raw_hostname.strip()
-                    if raw_hostname.strip():
-                        row_anomalies.append({
-                            "field": "hostname",
-                            "type": hostname_reason,
-                            "value": raw_hostname
-                        })
-                
-                # 3. FQDN Validation (RULES ONLY)
-                raw_fqdn = row.get("fqdn", "")
-                fqdn_valid, fqdn_reason = self.validate_fqdn(raw_fqdn)
-                steps.append("fqdn_trim")
-                
-                if fqdn_valid:
-                    steps.append("fqdn_validate")
-                    fqdn_out = raw_fqdn.strip()
-                    fqdn_consistent = self.check_fqdn_consistency(hostname_out, fqdn_out)
-                else:
-                    fqdn_out = raw_fqdn.strip()
-                    fqdn_consistent = False
-                    if raw_fqdn.strip():
-                        row_anomalies.append({
-                            "field": "fqdn",
-                            "type": fqdn_reason,
-                            "value": raw_fqdn
-                        })
-                
-                # 4. MAC Address Validation (RULES ONLY)
-                raw_mac = row.get("mac", "")
-                mac_valid, mac_normalized, mac_reason = self.normalize_mac(raw_mac)
-                steps.append("mac_trim")
-                
-                if mac_valid:
-                    steps.append("mac_normalize")
-                    mac_out = mac_normalized
-                else:
-                    mac_out = raw_mac.strip()
-                    if raw_mac.strip():
-                        steps.append(f"mac_invalid_{mac_reason}")
-                        row_anomalies.append({
-                            "field": "mac",
-                            "type": mac_reason,
-                            "value": raw_mac
-                        })
-                
-                # 5. Owner Parsing (LLM-BASED)
-                raw_owner = row.get("owner", "")
-                owner_name, owner_email, owner_team = self.parse_owner_llm(raw_owner, row_id)
-                steps.append("owner_parse_llm")
-                
-                # 6. Device Type Classification (LLM-BASED)
-                device_type, device_confidence = self.classify_device_type_llm(row)
-                steps.append(f"device_classify_llm_{device_confidence}")
-                
-                # 7. Site Normalization (RULES ONLY)
-                raw_site = row.get("site", "")
-                site_normalized = self.normalize_site(raw_site)
-                steps.append("site_normalize")
-                
-                # Build output row
-                output_row = {
-                    "ip": ip_normalized if ip_valid else raw_ip.strip(),
-                    "ip_valid": "true" if ip_valid else "false",
-                    "ip_version": ip_version,
-                    "subnet_cidr": subnet_cidr,
-                    "hostname": hostname_out,
-                    "hostname_valid": "true" if hostname_valid else "false",
-                    "fqdn": fqdn_out,
-                    "fqdn_consistent": "true" if fqdn_consistent else "false",
-                    "reverse_ptr": reverse_ptr,
-                    "mac": mac_out,
-                    "mac_valid": "true" if mac_valid else "false",
-                    "owner": owner_name,
-                    "owner_email": owner_email,
-                    "owner_team": owner_team,
-                    "device_type": device_type,
-                    "device_type_confidence": device_confidence,
-                    "site": raw_site.strip(),  # Keep original site value
-                    "site_normalized": site_normalized,  # Normalized version
+            
+            # 3. FQDN Validation (RULES ONLY)
+            fqdn = fqdns[idx]
+            fqdn_valid, fqdn_reason = fqdn_results[idx]
+            steps.append("fqdn_trim")
+            
+            if fqdn_valid:
+                steps.append("fqdn_validate")
+                fqdn_consistent = fqdn_consistency[idx]
+            else:
+                fqdn_consistent = False
+                if fqdn:
+                    row_anomalies.append({
+                        "field": "fqdn",
+                        "type": fqdn_reason,
+                        "value": raw_fqdns[idx]
+                    })
+            
+            # 4. MAC Address Validation (RULES ONLY)
+            mac = macs[idx]
+            mac_valid, mac_normalized, mac_reason = mac_results[idx]
+            steps.append("mac_trim")
+            
+            if mac_valid:
+                steps.append("mac_normalize")
+                mac_out = mac_normalized
+            else:
+                mac_out = mac
+                if mac:
+                    steps.append(f"mac_invalid_{mac_reason}")
+                    row_anomalies.append({
+                        "field": "mac",
+                        "type": mac_reason,
+                        "value": raw_macs[idx]
+                    })
+            
+            # 5. Owner Parsing (LLM-BASED) - bare emails, known team names
+            # and names matching their email are parsed by rules,
+            # everything else is deferred to the batched LLM pass
+            owner = owners[idx]
+            owner_parsed = owner_fast_results[idx]
+            
+            # 6. Device Type Classification (LLM-BASED) - explicitly provided
+            # and valid types are used as-is (high confidence), everything
+            # else (no lookup match) is deferred to the batched LLM pass
+            known_device_type = known_device_types[idx]
+            if known_device_type is not None:
+                device = (known_device_type, "high")
+            else:
+                device = None
+            device_inputs = (hostname, notes_column[idx], ip)
+            
+            # 7. Site Normalization (RULES ONLY)
+            site = sites[idx]
+            site_normalized = site_results[idx]
+            
+            # Partial output row; owner and device fields are filled in phase 3
+            output_row = OutputRow(
+                ip=ip_normalized if ip_valid else ip,
+                ip_valid="true" if ip_valid else "false",
+                ip_version=ip_version,
+                subnet_cidr=subnet_cidr,
+                hostname=hostname,
+                hostname_valid="true" if hostname_valid else "false",
+                fqdn=fqdn,
+                fqdn_consistent="true" if fqdn_consistent else "false",
+                reverse_ptr=reverse_ptr,
+                mac=mac_out,
+                mac_valid="true" if mac_valid else "false",
+                owner="",
+                owner_email="",
+                owner_team="",
+                device_type="",
+                device_type_confidence="",
+                site=site,  # Keep original site value
+                site_normalized=site_normalized,  # Normalized version
+                source_row_id=row_id,
+                normalization_steps=""
+            )
+            
+            records.append(RuleRecord(output_row, steps, owner, owner_parsed, device, device_inputs))
+            
+            # Add to anomalies if any issues found
+            if row_anomalies:
+                anomalies.append({
                     "source_row_id": row_id,
-                    "normalization_steps": "|".join(steps)
-                }
+                    "issues": row_anomalies,
+                    "recommended_actions": self.generate_recommendations(row_anomalies)
+                })
+        
+        return (records, anomalies)
+    
+    def iter_input_blocks(self) -> Iterator[Tuple[Dict[str, int], List[List[str]]]]:
+        """Read the input CSV through a large buffer, CSV_BLOCK_ROWS rows at a time.
+        
+        Rows are read positionally with csv.reader (no dict per row) and each
+        block comes with the header's name -> position map. Blank lines are
+        skipped, as csv.DictReader would.
+        """
+        with open(self.input_csv, 'r', newline='', encoding='utf-8', buffering=CSV_READ_BUFFER) as f:
+            reader = csv.reader(f)
+            # A repeated header name resolves to its last column, as in DictReader
+            columns = {name: pos for pos, name in enumerate(next(reader, []))}
+            rows = filter(None, reader)
+            while True:
+                block = list(itertools.islice(rows, CSV_BLOCK_ROWS))
+                if not block:
+                    return
+                yield (columns, block)
+    
+    def iter_rule_results(self) -> Iterator[Tuple[List[RuleRecord], List[Dict]]]:
+        """Yield apply_rules() results for each input block, in input order.
+        
+        Inputs of a single block are handled in-process; larger ones are
+        spread over RULES_WORKERS processes, keeping a bounded number of
+        blocks in flight so the input is still streamed.
+        """
+        blocks = self.iter_input_blocks()
+        head = list(itertools.islice(blocks, 2))
+        if len(head) < 2 or RULES_WORKERS <= 1:
+            for columns, block in itertools.chain(head, blocks):
+                yield self.apply_rules(columns, block)
+            return
+        
+        with ProcessPoolExecutor(max_workers=RULES_WORKERS, initializer=_init_rules_worker,
+                                 initargs=(self.input_csv,)) as executor:
+            in_flight = deque()
+            for columns, block in itertools.chain(head, blocks):
+                in_flight.append(executor.submit(_apply_rules_in_worker, columns, block))
+                if len(in_flight) > 2 * RULES_WORKERS:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+    
+    def iter_llm_queue_runs(self, records: List[RuleRecord]) -> Iterator[List[RuleRecord]]:
+        """Split a block's rule records into consecutive runs for the LLM queue.
+        
+        A run ends once LLM_QUEUE_ROWS owner/device inputs are waiting on the
+        LLM, so the queue stays bounded however many rows a block holds.
+        """
+        start = queued = 0
+        for idx, record in enumerate(records):
+            queued += (bool(record.owner) and record.owner_parsed is None) + (record.device is None)
+            if queued >= LLM_QUEUE_ROWS:
+                yield records[start:idx + 1]
+                start, queued = idx + 1, 0
+        if start < len(records):
+            yield records[start:]
+    
+    async def aiter_row_blocks(self) -> AsyncIterator[List[OutputRow]]:
+        """Main processing pipeline, yielding output rows as they are completed.
+        
+        Each block of input rows goes through a rules-only pass that collects
+        the owner/device fields needing the LLM. Those are queued in runs of at
+        most about LLM_QUEUE_ROWS inputs; each run is flushed through batched
+        LLM calls (run concurrently with asyncio) and its output rows are
+        assembled and yielded before the next run is queued.
+        """
+        for block_records, anomalies in self.iter_rule_results():
+            # Phase 1: rules-only pass (possibly in worker processes)
+            self.anomalies.extend(anomalies)
+            
+            for records in self.iter_llm_queue_runs(block_records):
+                pending_owner = []   # (record index, (row_id, owner text))
+                pending_device = []  # (record index, (row_id, hostname, notes, ip))
+                for idx, (output_row, _, owner, owner_parsed, device, device_inputs) in enumerate(records):
+                    row_id = output_row.source_row_id
+                    if owner and owner_parsed is None:
+                        pending_owner.append((idx, (row_id, owner)))
+                    if device is None:
+                        pending_device.append((idx, (row_id,) + device_inputs))
+                
+                # Phase 2: batched LLM calls (rules fallback when the LLM is unavailable)
+                parsed, classified = await self.run_llm_batches(
+                    [item for _, item in pending_owner],
+                    [item for _, item in pending_device]
+                )
+                owners = {idx: result for (idx, _), result in zip(pending_owner, parsed)}
+                devices = {idx: result for (idx, _), result in zip(pending_device, classified)}
                 
-                output_rows.append(output_row)
+                # Phase 3: zip the LLM results back onto their rows
+                output_rows = []
+                for idx, (output_row, steps, _, owner_parsed, device, _) in enumerate(records):
+                    if owner_parsed is not None:
+                        owner_name, owner_email, owner_team = owner_parsed
+                        steps.append("owner_parse_rules")
+                    else:
+                        owner_name, owner_email, owner_team = owners.get(idx, ("", "", ""))
+                        steps.append("owner_parse_llm")
+                    
+                    device_type, device_confidence = device or devices[idx]
+                    steps.append(f"device_classify_llm_{device_confidence}")
+                    
+                    steps.append("site_normalize")
+                    
+                    output_rows.append(output_row._replace(
+                        owner=owner_name,
+                        owner_email=owner_email,
+                        owner_team=owner_team,
+                        device_type=device_type,
+                        device_type_confidence=device_confidence,
+                        normalization_steps="|".join(steps)
+                    ))
                 
-                # Add to anomalies if any issues found
-                if row_anomalies:
-                    self.anomalies.append({
-                        "source_row_id": row_id,
-                        "issues": row_anomalies,
-                        "recommended_actions": self.generate_recommendations(row_anomalies)
-                    })
+                self.rows_processed += len(output_rows)
+                yield output_rows
+    
+    def iter_rows(self) -> Iterator[OutputRow]:
+        """Stream output rows from aiter_row_blocks() without an async caller.
         
-        return output_rows
+        The pipeline runs on a private event loop that is advanced one block
+        at a time, so save_outputs() can write rows as they are produced.
+        """
+        loop = asyncio.new_event_loop()
+        blocks = self.aiter_row_blocks()
+        try:
+            while True:
+                try:
+                    output_rows = loop.run_until_complete(blocks.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield from output_rows
+        finally:
+            loop.run_until_complete(blocks.aclose())
+            loop.close()
+    
+    async def process_async(self) -> List[OutputRow]:
+        """Run the whole pipeline and return every output row."""
+        return [row async for output_rows in self.aiter_row_blocks() for row in output_rows]
+    
+    def process(self) -> List[OutputRow]:
+        """Synchronous wrapper around process_async() (iter_rows streams instead)."""
+        return asyncio.run(self.process_async())
     
     def generate_recommendations(self, issues: List[Dict]) -> List[str]:
         """Generate recommendations for anomalies."""
@@ -591,31 +1522,27 @@ If uncertain or no clear indicators exist, use device_type: "unknown" with low c
         
         return recommendations if recommendations else ["Review and correct field data"]
     
-    def save_outputs(self, output_rows: List[Dict]):
-        """Save all output files."""
+    def save_outputs(self, output_rows: Iterable[OutputRow]):
+        """Save all output files.
+        
+        output_rows may be the iter_rows() generator, in which case rows are
+        written to the CSV as they are produced; anomalies and prompts.md are
+        written once every row has been consumed.
+        """
         
         try:
             # 1. Save inventory_clean.csv
-            print("  Creating inventory_clean.csv...", end="", flush=True)
-            with open("inventory_clean.csv", "w", newline="", encoding="utf-8") as f:
-                fieldnames = [
-                    "ip", "ip_valid", "ip_version", "subnet_cidr",
-                    "hostname", "hostname_valid", "fqdn", "fqdn_consistent", "reverse_ptr",
-                    "mac", "mac_valid",
-                    "owner", "owner_email", "owner_team",
-                    "device_type", "device_type_confidence",
-                    "site", "site_normalized",
-                    "source_row_id", "normalization_steps"
-                ]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
+            print("  Creating inventory_clean.csv...")
+            with open("inventory_clean.csv", "w", newline="", encoding="utf-8", buffering=OUTPUT_WRITE_BUFFER) as f:
+                writer = csv.writer(f)
+                writer.writerow(OUTPUT_FIELDNAMES)
                 writer.writerows(output_rows)
-            print(" ✓")
+            print("  inventory_clean.csv ✓")
             
             # 2. Save anomalies.json
             print("  Creating anomalies.json...", end="", flush=True)
-            with open("anomalies.json", "w", encoding="utf-8") as f:
-                json.dump(self.anomalies, f, indent=2)
+            with open("anomalies.json", "wb") as f:
+                f.write(dump_json(self.anomalies))
             print(" ✓")
             
             # 3. Save prompts.md
@@ -623,15 +1550,31 @@ If uncertain or no clear indicators exist, use device_type: "unknown" with low c
             self.create_prompts_md()
             print(" ✓")
             
+            # 4. Persist new LLM results for later runs
+            if LLM_CACHE_FILE and self.new_cache_entries:
+                print(f"  Updating {LLM_CACHE_FILE}...", end="", flush=True)
+                self.save_llm_cache()
+                print(" ✓")
+            
         except Exception as e:
             print(f"\n\n❌ ERROR: {e}")
             import traceback
             traceback.print_exc()
             raise
     
+    def _log_rows_label(self, row_ids: List[str], cache_hit: bool) -> str:
+        """"**Row 3**" or "**Rows 3, 8, 12** (cached)" for the rows of a call log entry."""
+        if len(row_ids) == 1:
+            label = f"**Row {row_ids[0]}**"
+        else:
+            label = f"**Rows {', '.join(row_ids)}**"
+        return f"{label} (cached)" if cache_hit else label
+    
     def create_prompts_md(self):
         """Document all LLM prompts used."""
-        content = """# prompts.md
+        # Pieces are collected and joined once: with thousands of logged calls,
+        # repeated += on one growing string is quadratic
+        parts = ["""# prompts.md
 
 ## LLM Interaction Log
 
@@ -650,43 +1593,21 @@ All other fields (IP, hostname, FQDN, MAC, site) use deterministic rules only.
 **Purpose:** Classify device types using contextual understanding of hostname patterns, notes, and IP addressing.
 
 **Model:** Gemini 3 Flash Preview (gemini-3-flash-preview)  
-**Temperature:** 0.1 (≤0.2 per assignment requirements)  
-**Output Format:** JSON
-
-**Trigger:** Device_type field is empty or not in known types
-
-**Prompt:**
-```
-Classify this network device type based on the information provided.
-
-Hostname: {hostname}
-Notes: {notes}
-IP Address: {ip}
-
-IMPORTANT INSTRUCTIONS:
-- Analyze the hostname patterns and notes carefully
-- If there is clear evidence (hostname contains srv, sw, rtr, etc. OR notes describe the device), classify it
-- If there is NO clear supporting information to determine the device type, respond with "unknown"
-- Do NOT guess if the information is insufficient
+**Temperature:** 0 (≤0.2 per assignment requirements)  
+**Output Format:** JSON array, constrained by a response schema
 
-Common patterns to look for:
-- Servers: srv, host, db, web, app, sql
-- Routers: rtr, router, gw, gateway, edge
-- Switches: sw, switch, core
-- Printers: print, printer
-- IoT devices: cam, camera, iot, sensor
-- Access Points: ap, wireless, wifi
-- Firewalls: fw, firewall
+**Trigger:** Device_type field is empty or neither a known type nor a common abbreviation of one (e.g. srv, ap, fw)
 
-Respond with a JSON object:
-{"device_type": "server", "confidence": 0.85, "reasoning": "Brief explanation of why you chose this classification"}
+**Batching:** Rows needing classification are sent LLM_BATCH_SIZE at a time (default 32) as a JSON array in a single request. Each element carries an `id` that matches its result back; a response that cannot be parsed is retried as two half batches.
 
-Valid device types: server, router, switch, printer, iot, firewall, access point, workstation, unknown
+**Prompt** (the system instruction, identical for every request, then the request's only content line):
+```
+""", DEVICE_SYSTEM_PROMPT, """
 
-If uncertain or no clear indicators exist, use device_type: "unknown" with low confidence.
+Devices: [{"id": 0, "hostname": "{hostname}", "notes": "{notes}", "ip": "{ip}"}, ...]
 ```
 
-**Rationale:** Device classification benefits from understanding context and naming conventions. The LLM is instructed to return "unknown" when there's insufficient information rather than guessing. This ensures that ambiguous devices are properly flagged for manual review. Low temperature (0.1) ensures deterministic outputs.
+**Rationale:** Device classification benefits from understanding context and naming conventions. The LLM is instructed to return "unknown" when there's insufficient information rather than guessing. This ensures that ambiguous devices are properly flagged for manual review. Temperature 0 ensures deterministic outputs.
 
 ---
 
@@ -695,50 +1616,18 @@ If uncertain or no clear indicators exist, use device_type: "unknown" with low c
 **Purpose:** Extract structured owner information from unstructured text.
 
 **Model:** Gemini 3 Flash Preview (gemini-3-flash-preview)  
-**Temperature:** 0.1  
-**Output Format:** JSON
-
-**Trigger:** Owner field is not empty
-
-**Prompt:**
-```
-Parse the owner information from this text into structured fields.
-
-Owner text: "{text}"
-
-IMPORTANT INSTRUCTIONS:
-1. If the text is a PROPER NOUN (person's name like "John", "Priya", "Jane"), put it in "name"
-2. If the text is a COMMON NOUN (team/department like "ops", "platform", "security", "facilities"), put it in "team"
-3. Extract any email addresses found
-4. A team in parentheses like "(engineering)" goes in "team"
-
-Examples:
-
-Input: "priya (platform) priya@corp.example.com"
-Output: {"name": "priya", "email": "priya@corp.example.com", "team": "platform"}
+**Temperature:** 0  
+**Output Format:** JSON array, constrained by a response schema
 
-Input: "ops"
-Output: {"name": "", "email": "", "team": "ops"}
-(Common noun = team, not a person name)
-
-Input: "platform"
-Output: {"name": "", "email": "", "team": "platform"}
-
-Input: "Facilities"
-Output: {"name": "", "email": "", "team": "Facilities"}
+**Trigger:** Owner field is not empty and is not a bare email address, a known lowercase team name, or a one-word name matching its email's local part (those are parsed by rules)
 
-Input: "jane@corp.example.com"
-Output: {"name": "jane", "email": "jane@corp.example.com", "team": ""}
-
-Input: "sec"
-Output: {"name": "", "email": "", "team": "sec"}
+**Batching:** Owner fields are sent LLM_BATCH_SIZE at a time (default 32) as a JSON array in a single request. Each element carries an `id` that matches its result back; a response that cannot be parsed is retried as two half batches.
 
-Extract:
-- name: Person's name (empty if the text is a team/department)
-- email: Email address (empty if not present)
-- team: Team/department name (empty if the text is a person's name)
+**Prompt** (the system instruction, identical for every request, then the request's only content line):
+```
+""", OWNER_SYSTEM_PROMPT, """
 
-Respond ONLY with valid JSON.
+Owner texts: [{"id": 0, "owner": "{text}"}, ...]
 ```
 
 **Rationale:** Owner fields require intelligent parsing to distinguish between person names (proper nouns) and team names (common nouns). For example, "ops" should be recognized as a team (operations), while "priya" should be recognized as a person's name. The LLM's natural language understanding can make this distinction better than regex patterns.
@@ -747,45 +1636,68 @@ Respond ONLY with valid JSON.
 
 ### LLM Calls Made
 
-"""
+"""]
         
-        if self.llm_calls_log:
-            device_calls = [c for c in self.llm_calls_log if c['purpose'] == 'device_type_classification']
-            owner_calls = [c for c in self.llm_calls_log if c['purpose'] == 'owner_parsing']
+        if self.llm_calls_log_by_purpose:
+            device_calls = self.llm_calls_log_by_purpose.get('device_type_classification')
+            owner_calls = self.llm_calls_log_by_purpose.get('owner_parsing')
             
             if device_calls:
-                content += "\n#### Device Type Classification\n\n"
-                for i, call in enumerate(device_calls, 1):
-                    content += f"**Row {call['source_row_id']}**\n"
-                    content += f"- Classification: {call['classification']}\n"
-                    content += f"- Confidence: {call['confidence']}\n"
-                    content += f"- Reasoning: {call['reasoning']}\n\n"
+                parts.append("\n#### Device Type Classification\n\n")
+                for row_ids, (classification, confidence, reasoning), cache_hit in zip(
+                    device_calls.row_ids, device_calls.fields, device_calls.cache_hits
+                ):
+                    parts.append(f"{self._log_rows_label(row_ids, cache_hit)}\n")
+                    parts.append(f"- Classification: {classification}\n")
+                    parts.append(f"- Confidence: {confidence}\n")
+                    parts.append(f"- Reasoning: {reasoning}\n\n")
             
             if owner_calls:
-                content += "\n#### Owner Parsing\n\n"
-                for i, call in enumerate(owner_calls, 1):
-                    content += f"**Row {call['source_row_id']}**\n"
-                    content += f"- Name: {call['parsed_name']}\n"
-                    content += f"- Email: {call['parsed_email']}\n"
-                    content += f"- Team: {call['parsed_team']}\n\n"
-            
-            content += f"\n**Total LLM Calls:** {len(self.llm_calls_log)}\n"
+                parts.append("\n#### Owner Parsing\n\n")
+                for row_ids, (name, email, team), cache_hit in zip(
+                    owner_calls.row_ids, owner_calls.fields, owner_calls.cache_hits
+                ):
+                    parts.append(f"{self._log_rows_label(row_ids, cache_hit)}\n")
+                    parts.append(f"- Name: {name}\n")
+                    parts.append(f"- Email: {email}\n")
+                    parts.append(f"- Team: {team}\n\n")
+            
+            parts.append(f"\n**Total LLM Calls:** {sum(self.llm_call_counts.values())}\n")
+            parts.append(f"**API Requests:** {self.backend.requests_sent} (batches of up to {LLM_BATCH_SIZE} rows)\n")
+            parts.append(f"**Cache Hits:** {self.llm_cache_hits} (rows reusing an earlier or shared result)\n")
         else:
-            content += "\n*No LLM calls were made.*\n"
+            parts.append("\n*No LLM calls were made.*\n")
         
-        with open("prompts.md", "w", encoding="utf-8") as f:
-            f.write(content)
+        # Encoded and written in one call rather than through a text buffer
+        Path("prompts.md").write_bytes("".join(parts).encode("utf-8"))
+
+
+# Rules-pass worker processes each hold their own normalizer
+_rules_worker = None
+
+
+def _init_rules_worker(input_csv: str):
+    global _rules_worker
+    # Workers only run the rules pass, so they skip the LLM backend and cache
+    _rules_worker = DataNormalizer(input_csv, rules_only=True)
+
+
+def _apply_rules_in_worker(columns: Dict[str, int], block: List[List[str]]) -> Tuple[List[RuleRecord], List[Dict]]:
+    return _rules_worker.apply_rules(columns, block)
 
 
 def main():
     input_csv = "inventory_raw.csv"
+    logging.basicConfig(level=LOG_LEVEL, format="    %(message)s")
     
     print("=" * 60)
     print("INFOBLOX DATA NORMALIZATION PIPELINE")
     print("=" * 60)
     print()
     
-    if HAS_GEMINI:
+    normalizer = DataNormalizer(input_csv)
+    
+    if normalizer.backend.enabled:
         print("✓ Google Gemini API available (using gemini-3-flash-preview)")
         print("  LLM enabled for: device_type and owner")
     else:
@@ -796,15 +1708,13 @@ def main():
     print(f"Input: {input_csv}")
     print()
     
-    normalizer = DataNormalizer(input_csv)
-    
-    print("Processing rows with rules and LLM...")
-    output_rows = normalizer.process()
-    print(f"✓ Processed {len(output_rows)} rows")
-    print()
-    
-    print("Generating outputs...")
-    normalizer.save_outputs(output_rows)
+    # Rows are streamed from the pipeline straight into inventory_clean.csv
+    print("Processing rows with rules and LLM, generating outputs...")
+    rows = normalizer.iter_rows()
+    if tqdm is not None:
+        rows = tqdm(rows, unit=" rows", mininterval=0.5, leave=False)
+    normalizer.save_outputs(rows)
+    print(f"✓ Processed {normalizer.rows_processed} rows")
     print()
     
     print("=" * 60)
@@ -812,12 +1722,15 @@ def main():
     print("=" * 60)
     print()
     print(f"Anomalies detected: {len(normalizer.anomalies)}")
-    print(f"LLM calls made: {len(normalizer.llm_calls_log)}")
-    if normalizer.llm_calls_log:
-        device_calls = len([c for c in normalizer.llm_calls_log if c['purpose'] == 'device_type_classification'])
-        owner_calls = len([c for c in normalizer.llm_calls_log if c['purpose'] == 'owner_parsing'])
-        print(f"  - Device type: {device_calls}")
-        print(f"  - Owner parsing: {owner_calls}")
+    # Cache hits are logged too, but did not cost a call
+    llm_calls = sum(normalizer.llm_call_counts.values())
+    print(f"LLM calls made: {llm_calls}")
+    if llm_calls:
+        print(f"  - Device type: {normalizer.llm_call_counts['device_type_classification']}")
+        print(f"  - Owner parsing: {normalizer.llm_call_counts['owner_parsing']}")
+        print(f"API requests sent: {normalizer.backend.requests_sent} (batch size {LLM_BATCH_SIZE})")
+    if normalizer.llm_cache_hits:
+        print(f"LLM cache hits: {normalizer.llm_cache_hits}")
     print()
     print("Check prompts.md for LLM interaction details!")
     print()